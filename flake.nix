@@ -13,7 +13,9 @@
         pythonPackages = ps: with ps; [
           fastapi
           uvicorn
-          apscheduler
+          croniter
+          orjson
+          ijson
         ];
         pythonEnv = pkgs.python311.withPackages pythonPackages;
       in {
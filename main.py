@@ -1,16 +1,35 @@
 
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
+import asyncio
 import traceback
 import ipaddress
+import functools
+import socket
+import re
 import subprocess
 import os
-import threading
-import shutil
 import json
 import logging
+import calendar
+import time
 from datetime import datetime, timezone
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from typing import AsyncIterator
+from croniter import croniter
+
+# Prefer orjson for decoding crictl output, fall back to the standard library
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Use ijson, when available, to pick single fields out of crictl output without
+# building the whole document
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # Configure debug mode via environment variable
 DEBUG_MODE = os.getenv("DEBUG", "false").lower() in ("true", "1", "yes")
@@ -19,6 +38,12 @@ DEBUG_MODE = os.getenv("DEBUG", "false").lower() in ("true", "1", "yes")
 PRUNE_SCHEDULE = os.getenv("PRUNE_SCHEDULE", "")
 PRUNE_DAYS = int(os.getenv("PRUNE_DAYS", "14"))
 
+# Maximum duration of a single image pull in seconds
+PULL_TIMEOUT = 30 * 60
+
+# Maximum number of crictl inspect commands run at the same time
+CRICTL_CONCURRENCY = int(os.getenv("CRICTL_CONCURRENCY", "8"))
+
 # Configure console logging
 console_handler = logging.StreamHandler()
 if DEBUG_MODE:
@@ -33,15 +58,29 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG if DEBUG_MODE else logging.INFO)
 logger.addHandler(console_handler)
 
-# Define image lock
-image_lock = threading.Lock()
+# Image lock, shared by pulls and prunes so a prune never removes images while a
+# pull is in progress. Created in startup_event on the serving event loop
+image_lock: asyncio.Lock | None = None
 
+# Environment variable prefixes set by container runtimes
+_PREFIXES = ('DOCKER_', 'containerd_')
+
+@functools.lru_cache(maxsize=1)
 def is_container() -> bool:
     """
     Detect if running inside a container using multiple methods.
     Returns True if inside a container, False otherwise.
+    Cheapest checks run first.
     """
-    # Method 1: Check /proc/1/cgroup for container markers
+    # Method 1: Check for .dockerenv file
+    if os.path.exists('/.dockerenv'):
+        return True
+    
+    # Method 2: Check Kubernetes environment variables
+    if os.environ.get('KUBERNETES_SERVICE_HOST'):
+        return True
+    
+    # Method 3: Check /proc/1/cgroup for container markers
     try:
         with open('/proc/1/cgroup', 'r') as f:
             cgroup_content = f.read()
@@ -51,60 +90,85 @@ def is_container() -> bool:
     except (FileNotFoundError, IOError):
         pass
     
-    # Method 2: Check for .dockerenv file
-    if os.path.exists('/.dockerenv'):
-        return True
-    
-    # Method 3: Check Kubernetes environment variables
-    if os.environ.get('KUBERNETES_SERVICE_HOST'):
-        return True
-    
     # Method 4: Check Docker environment variables
-    for env_var in os.environ.keys():
-        if env_var.startswith('DOCKER_') or env_var.startswith('containerd_'):
-            return True
-    
-    return False
+    return any(k.startswith(_PREFIXES) for k in os.environ)
 
 # Cache container detection result
 IN_CONTAINER = is_container()
 logger.info(f"Running in container: {IN_CONTAINER}")
 
+# Resolve host root and crictl binary once, neither changes while running
+NIX_CRICTL = '/nix/var/nix/profiles/system/sw/bin/crictl'
+if IN_CONTAINER:
+    HOST_ROOT = '/host'
+    _CRICTL = NIX_CRICTL if os.path.exists('/host/nix') else '/usr/bin/crictl'
+    _CRICTL_PREFIX = ('chroot', HOST_ROOT, _CRICTL)
+else:
+    HOST_ROOT = '/'
+    _CRICTL = NIX_CRICTL if os.path.exists(NIX_CRICTL) else '/usr/bin/crictl'
+    _CRICTL_PREFIX = (_CRICTL,)
+logger.debug(f"Using crictl command: {' '.join(_CRICTL_PREFIX)}")
+
 def get_allowed_network():
     env_cidr = os.getenv("ALLOWED_NETWORK", "0.0.0.0/1")
     try:
-        return ipaddress.ip_network(env_cidr)
+        return ipaddress.IPv4Network(env_cidr, strict=False)
+    except ValueError:
+        pass
+    try:
+        return ipaddress.IPv6Network(env_cidr, strict=False)
     except ValueError:
         return None
 
 ALLOWED_NETWORK = get_allowed_network()
 
-# Initialize scheduler
-scheduler = BackgroundScheduler(timezone=timezone.utc)
+# Precompute network membership as an inclusive integer address range
+_HAS_NETWORK = ALLOWED_NETWORK is not None
+_IS_V4 = isinstance(ALLOWED_NETWORK, ipaddress.IPv4Network)
+if _HAS_NETWORK:
+    _ALLOW_LO = int(ALLOWED_NETWORK.network_address)
+    _ALLOW_HI = int(ALLOWED_NETWORK.broadcast_address)
+    _ALLOW_FAMILY = socket.AF_INET if _IS_V4 else socket.AF_INET6
+
+# Image creation timestamps as reported by crictl, always UTC
+_RFC3339_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?Z?$')
 
-def run_prune_job():
+# Background task running the cron prune loop, set when PRUNE_SCHEDULE is configured
+_cron_task: asyncio.Task | None = None
+
+async def run_prune_job():
     """
     Wrapper function for scheduled prune operations.
     Uses the configured PRUNE_DAYS threshold.
     """
-    logger.info(f"Scheduled prune operation started (days threshold: {PRUNE_DAYS})")
-    run_prune(days=PRUNE_DAYS)
+    logger.info("Scheduled prune operation started (days threshold: %d)", PRUNE_DAYS)
+    await run_prune(days=PRUNE_DAYS)
+
+async def _cron_loop(schedule: croniter):
+    """
+    Sleep until the next cron fire time and run the prune job, forever.
+    Runs missed while a prune was still going are skipped rather than queued up.
+    """
+    while True:
+        next_fire = schedule.get_next(float, start_time=time.time())
+        await asyncio.sleep(max(0.0, next_fire - time.time()))
+        try:
+            await run_prune_job()
+        except Exception as e:
+            logger.error("Scheduled prune operation failed: %s", e)
 
 async def configure_scheduler():
     """
-    Configure the APIScheduler with cron job if PRUNE_SCHEDULE is set.
+    Start the cron prune task if PRUNE_SCHEDULE is set.
     """
+    global _cron_task
     if PRUNE_SCHEDULE:
         try:
-            trigger = CronTrigger.from_crontab(PRUNE_SCHEDULE)
-            scheduler.add_job(
-                run_prune_job,
-                trigger=trigger,
-                id="image_prune_job",
-                replace_existing=True
-            )
+            schedule = croniter(PRUNE_SCHEDULE, datetime.now(timezone.utc))
+            # Expressions that can never fire, e.g. '0 0 31 2 *', only fail here
+            schedule.get_next(float)
             logger.info(f"Cron scheduler configured successfully with expression: {PRUNE_SCHEDULE}")
-            scheduler.start()
+            _cron_task = asyncio.create_task(_cron_loop(schedule))
             logger.info("Image prune scheduler started")
         except Exception as e:
             logger.error(f"Failed to configure scheduler with cron expression '{PRUNE_SCHEDULE}': {str(e)}")
@@ -112,11 +176,12 @@ async def configure_scheduler():
 
 def cleanup_scheduler():
     """
-    Cleanup scheduler resources on shutdown.
+    Cancel the cron prune task on shutdown.
     """
-    if scheduler.running:
-        scheduler.remove_all_jobs()
-        scheduler.shutdown(wait=True)
+    global _cron_task
+    if _cron_task is not None:
+        _cron_task.cancel()
+        _cron_task = None
         logger.info("Image prune scheduler stopped")
 
 # Log startup
@@ -125,187 +190,537 @@ logger.info(f"Allowed network configured: {ALLOWED_NETWORK}")
 logger.info(f"Container detection: {IN_CONTAINER}")
 logger.info(f"Prune schedule configured: {PRUNE_SCHEDULE or 'Disabled'}")
 
-def run_pull(image: str):
-    logger.debug(f"Lock acquired for pull operation on image: {image}")
-    with image_lock:
-        logger.debug(f"Lock acquired for pull operation on image: {image}")
+# Free disk space is re-read at most once per DISK_CHECK_TTL seconds
+DISK_CHECK_TTL = 5
+MIN_FREE_BYTES = 50 * 2**30
+_last_disk_check = (0.0, 0)
+
+def _free_bytes() -> int:
+    """
+    Return bytes available to unprivileged users on the host root, cached for DISK_CHECK_TTL seconds.
+    """
+    global _last_disk_check
+    now = time.monotonic()
+    checked_at, free = _last_disk_check
+    if checked_at and now - checked_at < DISK_CHECK_TTL:
+        return free
+    st = os.statvfs(HOST_ROOT)
+    free = st.f_bavail * st.f_frsize
+    _last_disk_check = (now, free)
+    return free
+
+async def run_pull(image: str):
+    logger.debug("Waiting for lock for pull operation on image: %s", image)
+    async with image_lock:
+        logger.debug("Lock acquired for pull operation on image: %s", image)
         try:
-            disk_path = '/host' if IN_CONTAINER else '/'
-            if shutil.disk_usage(disk_path).free / (1024 ** 3) > 50:
-                result = run_in_host(['pull', image])
+            if _free_bytes() > MIN_FREE_BYTES:
+                result = await run_in_host(['pull', image], timeout=PULL_TIMEOUT)
                 
                 if result.returncode == 0:
-                    logger.info(f"Successfully pulled image: {image}")
+                    logger.info("Successfully pulled image: %s", image)
                     # Try to get image creation time for logging
-                    created_time = get_image_created(image)
-                    if created_time:
-                        logger.debug(f"  Image creation time: {created_time.isoformat()}")
+                    metadata = await get_all_image_metadata([image])
+                    created_time = next(iter(metadata.values()), None)
+                    if created_time is not None:
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("  Image creation time: %s", format_epoch(created_time))
                     else:
                         logger.warning("Image creation time missing")
                 else:
-                    logger.error(f"Failed to pull image {image}: Command returned code {result.returncode}, stderr: {result.stderr}")
+                    logger.error("Failed to pull image %s: Command returned code %d, stderr: %s", image, result.returncode, result.stderr)
             else:
-                logger.warning(f"Insufficient storage available for pulling image: {image}")
-        except subprocess.TimeoutExpired:
-            logger.error(f"Pull operation timed out for image: {image}, command was blocked after 30 minutes")
+                logger.warning("Insufficient storage available for pulling image: %s", image)
+        except asyncio.TimeoutError:
+            logger.error("Pull operation timed out for image: %s, command was blocked after 30 minutes", image)
         except FileNotFoundError as e:
-            logger.error(f"Required binary not found during pull for image {image}: {str(e)}")
+            logger.error("Required binary not found during pull for image %s: %s", image, e)
         except Exception as e:
-            logger.error(f"Unexpected error during pull for {image}: {str(e)}\n{traceback.format_exc()}")
-    logger.debug(f"Lock released after pull operation for image: {image}")
+            logger.error("Unexpected error during pull for %s: %s: %s", image, type(e).__name__, e)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Traceback:\n%s", traceback.format_exc())
+    logger.debug("Lock released after pull operation for image: %s", image)
 
 def is_allowed_ip(remote_ip: str) -> bool:
+    if not _HAS_NETWORK:
+        return False
+    # inet_pton only accepts addresses of the allowed network's family
     try:
-        ip = ipaddress.ip_address(remote_ip)
-        return ALLOWED_NETWORK is not None and ip in ALLOWED_NETWORK
-    except ValueError:
+        ip_int = int.from_bytes(socket.inet_pton(_ALLOW_FAMILY, remote_ip), 'big')
+    except (OSError, ValueError):
         return False
+    return _ALLOW_LO <= ip_int <= _ALLOW_HI
+
+def parse_rfc3339_epoch(ts: str) -> float:
+    # Python 3.11+ parses 'Z' and long fractional seconds natively; timestamps without offset are UTC
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        return _parse_rfc3339_epoch_fallback(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _parse_rfc3339_epoch_fallback(ts: str) -> float:
+    # Extract fields directly and convert to POSIX seconds, keeping microsecond precision
+    m = _RFC3339_RE.match(ts)
+    if m is None:
+        raise ValueError(f"Invalid RFC 3339 timestamp: {ts}")
+    g = m.groups()
+    us = int((g[6] or '0')[:6].ljust(6, '0'))
+    return calendar.timegm((int(g[0]), int(g[1]), int(g[2]), int(g[3]), int(g[4]), int(g[5]), 0, 0, 0)) + us / 1e6
+
+def format_epoch(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+def parse_json_documents(data: bytes) -> list[dict]:
+    """
+    Parse crictl output for several objects at once.
+    Accepts a JSON array, a single object or a stream of concatenated JSON objects.
+    """
+    try:
+        obj = json_loads(data)
+        return obj if isinstance(obj, list) else [obj]
+    except json.JSONDecodeError:
+        pass
+
+    # crictl prints one indented object per ID back to back, so top-level objects
+    # end with a closing brace in the first column
+    try:
+        return [json_loads(part + b'}') for part in data.rstrip().split(b'\n}') if part.strip()]
+    except json.JSONDecodeError:
+        pass
+
+    # Unknown layout, walk the objects one at a time
+    text = data.decode()
+    decoder = json.JSONDecoder()
+    docs = []
+    pos = 0
+    end = len(text)
+    while True:
+        while pos < end and text[pos].isspace():
+            pos += 1
+        if pos >= end:
+            break
+        obj, pos = decoder.raw_decode(text, pos)
+        if isinstance(obj, list):
+            docs.extend(obj)
+        else:
+            docs.append(obj)
+    return docs
+
+# ijson events that carry a value rather than structure
+JSON_VALUE_EVENTS = ('null', 'boolean', 'integer', 'double', 'number', 'string')
+
+def collect_json_fields(events, paths: tuple[str, ...], state: dict):
+    """
+    Fold ijson (prefix, event, value) events into state['docs'].
+    Documents are the top-level values or the items of a top-level array.
+    """
+    for prefix, event, value in events:
+        if prefix == '' and event in ('start_array', 'end_array'):
+            state['in_array'] = event == 'start_array'
+            continue
+        base = 'item' if state['in_array'] else ''
+        if prefix == base:
+            if event == 'start_map':
+                state['fields'] = {}
+            elif event == 'end_map':
+                state['docs'].append(state['fields'])
+                state['fields'] = None
+            continue
+        if state['fields'] is None or event not in JSON_VALUE_EVENTS:
+            continue
+        path = prefix[len(base) + 1:] if base else prefix
+        if path in paths:
+            state['fields'][path] = value
+
+def extract_json_fields(data: bytes, paths: tuple[str, ...]) -> list[dict]:
+    """
+    Return, for every document in crictl output, a dict mapping each of the
+    dotted paths (e.g. 'status.imageRef') to its value, if present.
+    Decodes the whole output, used when ijson is not installed.
+    """
+    docs = []
+    for obj in parse_json_documents(data):
+        fields = {}
+        for path in paths:
+            value = obj
+            for key in path.split('.'):
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                fields[path] = value
+        docs.append(fields)
+    return docs
+
+# Size of the chunks read from crictl stdout while streaming JSON
+STREAM_CHUNK_SIZE = 64 * 1024
+
+async def read_json_fields(stream: asyncio.StreamReader, paths: tuple[str, ...]) -> list[dict]:
+    """
+    Like extract_json_fields, but parses crictl stdout while it is being produced
+    instead of buffering it first. Raises ValueError on malformed output.
+    """
+    if ijson is None:
+        return extract_json_fields(await stream.read(), paths)
+
+    state = {'in_array': False, 'fields': None, 'docs': []}
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events, multiple_values=True)
+    received = False
+    try:
+        while chunk := await stream.read(STREAM_CHUNK_SIZE):
+            received = received or not chunk.isspace()
+            parser.send(chunk)
+            collect_json_fields(events, paths, state)
+            del events[:]
+        # Empty output means no documents, not truncated JSON
+        if received:
+            parser.close()
+    except ijson.JSONError as e:
+        raise ValueError(f"Invalid JSON output: {str(e)}")
+    collect_json_fields(events, paths, state)
+    return state['docs']
+
+async def inspect_each(verb: str, ids: list[str], fields: tuple[str, ...]) -> list[dict]:
+    """
+    Run `crictl <verb> <id>` for every ID, at most CRICTL_CONCURRENCY at a time,
+    and return the extracted fields of all documents. Used when a batched inspect
+    failed; IDs that cannot be inspected are logged and skipped.
+    """
+    semaphore = asyncio.Semaphore(CRICTL_CONCURRENCY)
+
+    async def inspect_one(item_id: str) -> list[dict]:
+        async with semaphore:
+            try:
+                return await run_json_in_host([verb, item_id], fields)
+            except subprocess.CalledProcessError as e:
+                logger.warning("crictl %s failed for %s: %s", verb, item_id, e.stderr)
+            except ValueError as e:
+                logger.error("Failed to parse crictl %s output for %s: %s", verb, item_id, e)
+            return []
 
-def parse_rfc3339(ts: str) -> datetime:
-    # Trim trailing Z and normalize fractional seconds to microseconds
-    ts = ts.rstrip("Z")
-    if "." in ts:
-        base, frac = ts.split(".", 1)
-        frac = (frac + "000000")[:6]
-        ts = f"{base}.{frac}"
-    return datetime.fromisoformat(ts).replace(tzinfo=timezone.utc)
+    results = await asyncio.gather(*(inspect_one(item_id) for item_id in ids))
+    return [obj for docs in results for obj in docs]
 
-def get_used_images() -> set[str]:
+async def get_used_images() -> set[str]:
     """
     Return a set of image references used by any container.
     """
-    ps = run_in_host(['ps', '-a', '-q'])
-    if ps.returncode != 0:
-        logger.error(f"crictl ps failed: {ps.stderr}")
+    try:
+        # Container IDs are hex, decode only what is passed on to crictl
+        ids = [cid.decode('ascii') async for cid in run_lines_in_host(['ps', '-a', '-q'])]
+    except subprocess.CalledProcessError as e:
+        logger.error("crictl ps failed: %s", e.stderr)
         return set()
 
-    ids = ps.stdout.strip().splitlines()
     if not ids:
         logger.debug("No running containers found")
         return set()
 
+    logger.debug("Inspecting %d containers", len(ids))
+    fields = ('status.id', 'status.imageRef')
+    try:
+        containers = await run_json_in_host(['inspect'] + ids, fields)
+    except subprocess.CalledProcessError as e:
+        # A container may have exited since it was listed, which fails the whole batch
+        logger.debug("Batched crictl inspect failed, inspecting containers one by one: %s", e.stderr)
+        containers = await inspect_each('inspect', ids, fields)
+
     used = set()
-    for cid in ids:
-        logger.debug(f"Checking container ID: {cid}")
-        insp = run_in_host(['inspect', cid])
-        if insp.returncode != 0:
-            logger.debug(f"Failed to inspect container {cid}")
-            continue
-        obj = json.loads(insp.stdout)
-        ref = obj.get("status", {}).get("imageRef")
+    for obj in containers:
+        ref = obj.get("status.imageRef")
         if ref:
-            logger.debug(f"Container {cid} uses image: {ref}")
+            logger.debug("Container %s uses image: %s", obj.get('status.id'), ref)
             used.add(ref)
-    logger.info(f"Identified {len(used)} used images")
+    logger.info("Identified %d used images", len(used))
+    return used
+
+# Images in use are reused across prunes started within USED_IMAGES_TTL seconds
+USED_IMAGES_TTL = 10
+_used_cache: tuple[float, set[str]] | None = None
+
+async def get_used_images_cached(ttl: float = USED_IMAGES_TTL) -> set[str]:
+    """
+    Return get_used_images(), reusing the previous result if it is younger than ttl seconds.
+    """
+    global _used_cache
+    now = time.monotonic()
+    if _used_cache is not None and now - _used_cache[0] < ttl:
+        logger.debug("Using cached set of %d used images", len(_used_cache[1]))
+        return _used_cache[1]
+    used = await get_used_images()
+    _used_cache = (now, used)
     return used
 
-def get_all_images() -> list[str]:
+async def get_all_images() -> list[str]:
+    """
+    Return the IDs of all images. The CRI image list carries no creation time,
+    that comes from get_all_image_metadata.
+    """
     logger.debug("Fetching list of all images")
-    img = run_in_host(['images', '-q'])
-    if img.returncode != 0:
-        logger.error(f"crictl images failed: {img.stderr}")
+    try:
+        # Image IDs are hex digests, decode only what is passed on to crictl
+        image_list = [img.decode('ascii') async for img in run_lines_in_host(['images', '-q'])]
+    except subprocess.CalledProcessError as e:
+        logger.error("crictl images failed: %s", e.stderr)
         return []
-    image_list = img.stdout.strip().splitlines()
-    logger.debug(f"Found {len(image_list)} images to check: {', '.join(image_list[:10])}{'...' if len(image_list) > 10 else ''}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found %d images to check: %s%s", len(image_list), ', '.join(image_list[:10]), '...' if len(image_list) > 10 else '')
     return image_list
 
-def get_image_created(img_id: str) -> datetime | None:
+# Creation times never change for an image ID, so they are kept across prunes
+# and only evicted once the image is gone
+_CREATED_CACHE: dict[str, float] = {}
+
+def evict_created_cache(image_ids: set[str]):
     """
-    Return creation time from .info.imageSpec.created for an image, or None.
+    Drop cached creation times of images that no longer exist.
     """
-    insp = run_in_host(['inspecti', img_id])
-    if insp.returncode != 0:
-        logger.error(f"Inspect failed for image {img_id}: {insp.stderr}")
-        return None
-    try:
-        data = json.loads(insp.stdout)
-    except json.JSONDecodeError as e:
-        return None
+    global _CREATED_CACHE
+    _CREATED_CACHE = {k: v for k, v in _CREATED_CACHE.items() if k in image_ids}
 
-    created = (
-        data.get("info", {})
-            .get("imageSpec", {})
-            .get("created")
-    )
-    if not created:
-        return None
+async def get_all_image_metadata(ids: list[str]) -> dict[str, float]:
+    """
+    Return a mapping of image ID to creation time (POSIX seconds) from .info.imageSpec.created,
+    using a single crictl inspecti call for images not seen before. Images without a
+    creation time are omitted.
+    """
+    metadata = {img_id: _CREATED_CACHE[img_id] for img_id in ids if img_id in _CREATED_CACHE}
+    ids = [img_id for img_id in ids if img_id not in metadata]
+    if not ids:
+        return metadata
+    fields = ('status.id', 'info.imageSpec.created')
     try:
-        return parse_rfc3339(created)
-    except Exception:
-        return None
+        docs = await run_json_in_host(['inspecti'] + ids, fields)
+    except subprocess.CalledProcessError as e:
+        # An image may have been removed since it was listed, which fails the whole batch
+        logger.debug("Batched crictl inspecti failed, inspecting images one by one: %s", e.stderr)
+        docs = await inspect_each('inspecti', ids, fields)
+    except ValueError as e:
+        logger.error("Failed to parse image inspect output: %s", e)
+        return metadata
+
+    for data in docs:
+        img_id = data.get("status.id")
+        created = data.get("info.imageSpec.created")
+        if not img_id or not created:
+            continue
+        try:
+            metadata[img_id] = _CREATED_CACHE[img_id] = parse_rfc3339_epoch(created)
+        except Exception:
+            continue
+    return metadata
 
-def run_in_host(cmd):
+def host_command(cmd: list[str]) -> tuple[str, ...]:
     """
-    Helper to run commands in /host chroot, picking the right crictl binary.
-    cmd is a list starting with the tool name, e.g. ['crictl', 'pull', image]
+    Build the full crictl command line, chrooting into /host when in a container.
     """
-    if IN_CONTAINER:
-        if os.path.exists('/host/nix'):
-            full_cmd = ['chroot', '/host', '/nix/var/nix/profiles/system/sw/bin/crictl'] + cmd
-        else:
-            full_cmd = ['chroot', '/host', '/usr/bin/crictl'] + cmd
-    else:
-        if os.path.exists('/nix/var/nix/profiles/system/sw/bin/crictl'):
-            full_cmd = ['/nix/var/nix/profiles/system/sw/bin/crictl'] + cmd
-        else:
-            full_cmd = ['/usr/bin/crictl'] + cmd
+    return (*_CRICTL_PREFIX, *cmd)
+
+# Largest crictl output that is dumped verbatim in debug logs
+MAX_LOGGED_OUTPUT = 8192
+
+def log_command_result(result: subprocess.CompletedProcess):
+    """
+    Log a crictl result summary; full output only in debug mode and when small.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Command return=%d stdout_len=%d stderr_len=%d", result.returncode, len(result.stdout), len(result.stderr))
+    if result.stderr and len(result.stderr) < MAX_LOGGED_OUTPUT:
+        logger.debug("Command stderr: %s", result.stderr)
+    if result.stdout and len(result.stdout) < MAX_LOGGED_OUTPUT:
+        logger.debug("Command stdout: %s", result.stdout.decode(errors='replace'))
+
+async def _spawn_in_host(cmd) -> tuple[tuple[str, ...], asyncio.subprocess.Process]:
+    """
+    Start a crictl command with stdout and stderr piped.
+    Returns the full command line and the process.
+    """
+    full_cmd = host_command(cmd)
     try:
-        result = subprocess.run(full_cmd, check=False, capture_output=True, text=True)
-        logger.debug(f"Command completed with return code {result.returncode}")
-        #if result.stderr:
-        #    logger.debug(f"Command stderr: {result.stderr}")
-        #if result.stdout:
-        #    logger.debug(f"Command stdout: {result.stdout}")
-        return result
+        proc = await asyncio.create_subprocess_exec(
+            *full_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
     except Exception as e:
-        logger.debug(f"Error executing command {' '.join(cmd)}: {str(e)}")
+        logger.debug("Error executing command %s: %s", cmd, e)
         raise RuntimeError(f"Command execution failed: {str(e)}")
+    return full_cmd, proc
 
-def run_prune(days: int = 14):
+async def _reap(proc: asyncio.subprocess.Process, stderr_task: asyncio.Task):
+    """
+    Make sure a crictl process from _spawn_in_host is gone. One still running is
+    killed and its stdout discarded until EOF, so it cannot block on a full pipe
+    while the image lock is held.
+    """
+    if proc.returncode is None:
+        proc.kill()
+        while await proc.stdout.read(STREAM_CHUNK_SIZE):
+            pass
+        await proc.wait()
+    if not stderr_task.done():
+        stderr_task.cancel()
+
+async def run_in_host(cmd, timeout: float | None = None):
+    """
+    Helper to run commands in /host chroot, picking the right crictl binary.
+    cmd is a list of crictl arguments, e.g. ['pull', image]
+    stdout is returned as bytes for the JSON decoder, stderr is decoded for logging.
+    Raises asyncio.TimeoutError if the command does not finish within timeout.
+    """
+    full_cmd, proc = await _spawn_in_host(cmd)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    result = subprocess.CompletedProcess(full_cmd, proc.returncode, stdout, stderr.decode())
+    log_command_result(result)
+    return result
+
+async def run_lines_in_host(cmd) -> AsyncIterator[bytes]:
+    """
+    Run a crictl command and yield its non-empty stdout lines as raw bytes as they arrive.
+    Raises subprocess.CalledProcessError if the command fails.
+    """
+    full_cmd, proc = await _spawn_in_host(cmd)
+    # Read stderr alongside stdout, a full stderr pipe would otherwise block crictl
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    try:
+        async for line in proc.stdout:
+            line = line.rstrip()
+            if line:
+                yield line
+        stderr = await stderr_task
+        await proc.wait()
+    finally:
+        await _reap(proc, stderr_task)
+    logger.debug("Command completed with return code %d", proc.returncode)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, full_cmd, stderr=stderr.decode())
+
+async def run_json_in_host(cmd, paths: tuple[str, ...]) -> list[dict]:
+    """
+    Run a crictl command with JSON output and stream it into read_json_fields.
+    Raises subprocess.CalledProcessError if the command fails, ValueError if the
+    output cannot be parsed.
+    """
+    full_cmd, proc = await _spawn_in_host(cmd)
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    try:
+        # On a parse error _reap stops crictl, nothing else reads the rest of stdout
+        docs = await read_json_fields(proc.stdout, paths)
+        stderr = await stderr_task
+        await proc.wait()
+    finally:
+        await _reap(proc, stderr_task)
+    logger.debug("Command completed with return code %d", proc.returncode)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, full_cmd, stderr=stderr.decode())
+    return docs
+
+# Number of crictl rmi commands run at the same time during a prune
+PRUNE_CONCURRENCY = 4
+
+async def remove_images(batch: list[tuple[str, float]]) -> int:
+    """
+    Remove a batch of (image ID, creation time) with a single crictl rmi call.
+    Returns the number of images removed.
+    crictl reports removals by repo tag or digest rather than ID, so after a failed
+    call the images are listed again and any ID still present counts as failed.
+    """
+    r = await run_in_host(['rmi'] + [img for img, _ in batch])
+    failed = []
+    if r.returncode != 0:
+        try:
+            remaining = {img.decode('ascii') async for img in run_lines_in_host(['images', '-q'])}
+        except subprocess.CalledProcessError as e:
+            logger.error("crictl images failed after removal error: %s", e.stderr)
+            remaining = {img for img, _ in batch}
+        failed = sorted(img for img, _ in batch if img in remaining)
+        logger.error("Failed to remove images %s: Command returned code %d, stderr: %s", ', '.join(failed), r.returncode, r.stderr)
+    for img, created_ts in batch:
+        if img not in failed:
+            logger.info("Successfully pruned image: %s, created: %s", img, format_epoch(created_ts))
+    return len(batch) - len(failed)
+
+async def run_prune(days: int = 14):
     """
     Prune images that are:
     - older than `days`
     - not used by any container
     """
-    logger.info(f"Pruning operation started with {days} days threshold")
+    logger.info("Pruning operation started with %d days threshold", days)
     images_pruned = 0
     errors = 0
-    
-    with image_lock:
-        logger.debug(f"Lock acquired for pruning operation with {days} days threshold")
-        now = datetime.now(timezone.utc)
-        cutoff_seconds = days * 24 * 60 * 60
 
-        used_images = get_used_images()
-        all_images = get_all_images()
-        logger.info(f"Found {len(all_images)} total images, {len(used_images)} in use")
+    async with image_lock:
+        logger.debug("Lock acquired for pruning operation with %d days threshold", days)
+        now_ts = time.time()
+        cutoff_ts = now_ts - days * 24 * 60 * 60
 
+        used_images = frozenset(await get_used_images_cached())
+        all_images = await get_all_images()
+        evict_created_cache(set(all_images))
+        logger.info("Found %d total images, %d in use", len(all_images), len(used_images))
+
+        # Drop images in use first, so only unused images are inspected
+        candidates = []
         for img in all_images:
-            logger.debug(f"Processing image: {img}")
-            created_dt = get_image_created(img)
-            if not created_dt:
-                logger.warning(f"Could not determine creation time for image: {img}")
+            if img in used_images:
+                logger.debug("Skipping image: %s, reason: in use by running container", img)
                 continue
-
-            age_seconds = (now - created_dt).total_seconds()
-            if age_seconds < cutoff_seconds:
-                logger.debug(f"Skipping image: {img}, reason: too new ({age_seconds/86400:.1f} days < {days} days)")
+            candidates.append(img)
+        created_times = await get_all_image_metadata(candidates) if candidates else {}
+
+        to_prune = []
+        for img in candidates:
+            logger.debug("Processing image: %s", img)
+            created_ts = created_times.get(img)
+            if created_ts is None:
+                logger.warning("Could not determine creation time for image: %s", img)
                 continue
 
-            if img in used_images:
-                logger.debug(f"Skipping image: {img}, reason: in use by running container")
+            if created_ts > cutoff_ts:
+                logger.debug("Skipping image: %s, reason: too new (%.1f days < %d days)", img, (now_ts - created_ts) / 86400, days)
                 continue
 
-            logger.debug(f"Attempting to prune image: {img}, age={age_seconds/86400:.1f} days, created={created_dt.isoformat()}")
-            r = run_in_host(['rmi', img])
-            if r.returncode != 0:
-                logger.error(f"Failed to remove image {img}: Command returned code {r.returncode}, stderr: {r.stderr}")
-                errors += 1
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Attempting to prune image: %s, age=%.1f days, created=%s", img, (now_ts - created_ts) / 86400, format_epoch(created_ts))
+            to_prune.append((img, created_ts))
+
+        # Split removals into at most PRUNE_CONCURRENCY crictl calls run side by side
+        batches = [to_prune[i::PRUNE_CONCURRENCY] for i in range(PRUNE_CONCURRENCY) if to_prune[i::PRUNE_CONCURRENCY]]
+        results = await asyncio.gather(*(remove_images(batch) for batch in batches), return_exceptions=True)
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                logger.error("Unexpected error while removing images %s: %s", ', '.join(img for img, _ in batch), result)
+                errors += len(batch)
             else:
-                logger.info(f"Successfully pruned image: {img}, created: {created_dt.isoformat()}")
-                images_pruned += 1
+                images_pruned += result
+                errors += len(batch) - result
 
-    logger.info(f"Pruning operation completed. Removed {images_pruned} images, {errors} errors")
+    logger.info("Pruning operation completed. Removed %d images, %d errors", images_pruned, errors)
+
+# Maximum number of queued pull/prune requests
+QUEUE_SIZE = 256
+
+async def queue_worker(queue: asyncio.Queue, func):
+    """
+    Drain a work queue one item at a time, awaiting func for each item.
+    """
+    while True:
+        arg = await queue.get()
+        try:
+            await func(arg)
+        except Exception as e:
+            logger.error("Unexpected error in %s worker: %s", func.__name__, e)
+        finally:
+            queue.task_done()
 
 # Configure FastAPI app
 app = FastAPI(
@@ -316,11 +731,48 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Endpoints restricted to ALLOWED_NETWORK, with the operation name used in logs
+GUARDED_PATHS = {
+    "/pull-image": "pull",
+    "/prune-images": "prune",
+}
+
+class IPGuardMiddleware:
+    """
+    Reject requests to guarded endpoints from clients outside ALLOWED_NETWORK
+    before routing or request body parsing.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            operation = GUARDED_PATHS.get(scope["path"])
+            if operation is not None:
+                client = scope.get("client")
+                remote_ip = client[0] if client else ""
+                if not is_allowed_ip(remote_ip):
+                    logger.warning("Blocked %s attempt from IP: %s", operation, remote_ip)
+                    response = JSONResponse({"detail": "Forbidden"}, status_code=403)
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+app.add_middleware(IPGuardMiddleware)
+
 @app.on_event("startup")
 async def startup_event():
     """
     Handle application startup events.
     """
+    global image_lock
+    image_lock = asyncio.Lock()
+    app.state.pull_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    app.state.prune_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    app.state.workers = [
+        asyncio.create_task(queue_worker(app.state.pull_queue, run_pull)),
+        asyncio.create_task(queue_worker(app.state.prune_queue, run_prune)),
+    ]
     await configure_scheduler()
     logger.info("Application startup complete")
 
@@ -330,44 +782,47 @@ async def shutdown_event():
     Handle application shutdown events.
     """
     cleanup_scheduler()
+    for worker in app.state.workers:
+        worker.cancel()
     logger.info("Application shutdown complete")
 
 @app.post("/pull-image")
-async def pull_image(request: Request, background_tasks: BackgroundTasks):
+async def pull_image(request: Request):
     remote_ip = request.client.host
-    if not is_allowed_ip(remote_ip):
-        logger.warning(f"Blocked pull attempt from IP: {remote_ip}")
-        raise HTTPException(status_code=403, detail="Forbidden")
 
     data = await request.json()
     image = data.get("image")
     if not image:
-        logger.warning(f"Pull request failed - No image provided from IP: {remote_ip}")
+        logger.warning("Pull request failed - No image provided from IP: %s", remote_ip)
         raise HTTPException(status_code=400, detail="No image provided")
 
     original_image = image
-    if image.count('/') <= 1 and not image.startswith('docker.io/'):
+    # Same rule as containerd: the first component is a registry if it looks like a host
+    first, sep, _ = image.partition('/')
+    has_registry = sep and ('.' in first or ':' in first or first == 'localhost')
+    if not has_registry:
         image = "docker.io/" + image
-        logger.info(f"Added docker.io prefix to image: {original_image}")
+        logger.info("Added docker.io prefix to image: %s", original_image)
 
     if not image or not image.strip():
-        logger.warning(f"Pull request failed - Invalid image name: {image}")
+        logger.warning("Pull request failed - Invalid image name: %s", image)
         raise HTTPException(status_code=400, detail="Invalid image name")
 
-    background_tasks.add_task(run_pull, image)
-    logger.info(f"Background pull task added for image: {image} from IP: {remote_ip}")
+    try:
+        app.state.pull_queue.put_nowait(image)
+    except asyncio.QueueFull:
+        logger.warning("Pull request rejected - queue full for image: %s from IP: %s", image, remote_ip)
+        raise HTTPException(status_code=429, detail="Too many pending pull requests")
+    logger.info("Background pull task added for image: %s from IP: %s", image, remote_ip)
     return {"status": "ok", "message": "Pull request received and will be processed in background"}
 
 @app.post("/prune-images")
-async def prune_images(request: Request, background_tasks: BackgroundTasks):
+async def prune_images(request: Request):
     """
     Trigger pruning of unused images older than 14 days.
     Optional JSON body: {"days": 14}
     """
     remote_ip = request.client.host
-    if not is_allowed_ip(remote_ip):
-        logger.warning(f"Blocked prune attempt from IP: {remote_ip}")
-        raise HTTPException(status_code=403, detail="Forbidden")
 
     days = 14
     try:
@@ -377,16 +832,19 @@ async def prune_images(request: Request, background_tasks: BackgroundTasks):
             try:
                 days = int(days)
             except (TypeError, ValueError) as e:
-                logger.warning(f"Prune request failed - Invalid days value: {days} from IP: {remote_ip}: {str(e)}")
+                logger.warning("Prune request failed - Invalid days value: %s from IP: %s: %s", days, remote_ip, e)
                 raise HTTPException(status_code=400, detail="Invalid days value")
     except Exception as e:
-        logger.info(f"Prune request received without JSON body or with invalid JSON from IP: {remote_ip}")
+        logger.info("Prune request received without JSON body or with invalid JSON from IP: %s", remote_ip)
         days = 14
 
-    logger.info(f"Starting prune operation with {days} days threshold from IP: {remote_ip}")
+    logger.info("Starting prune operation with %d days threshold from IP: %s", days, remote_ip)
     try:
-        background_tasks.add_task(run_prune, days)
+        app.state.prune_queue.put_nowait(days)
         return {"status": "ok", "days": days}
+    except asyncio.QueueFull:
+        logger.warning("Prune request rejected - queue full from IP: %s", remote_ip)
+        raise HTTPException(status_code=429, detail="Too many pending prune requests")
     except Exception as e:
-        logger.error(f"Failed to start prune operation from IP {remote_ip}: {str(e)}")
+        logger.error("Failed to start prune operation from IP %s: %s", remote_ip, e)
         raise HTTPException(status_code=500, detail=f"Failed to start prune operation: {str(e)}")